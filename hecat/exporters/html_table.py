@@ -206,7 +206,7 @@ def render_html_table(step):
         sys.exit(1)
     if 'archive_dir' not in step['module_options']:
         step['module_options']['archive_dir'] = 'webpages'
-    data = load_yaml_data(step['module_options']['source_file'])
+    data = load_yaml_data(step['module_options']['source_file'], typ='safe', cache=True)
     link_count = len(data)
     html_template = Template(HTML_JINJA)
     html_template.globals['jinja_markdown'] = jinja_markdown
@@ -343,10 +343,10 @@ def render_markdown_multipage(step):
         step['module_options']['exclude_licenses'] = []
     if 'output_file' not in step['module_options']:
         step['module_options']['output_file'] = 'index.md'
-    tags = load_yaml_data(step['module_options']['source_directory'] + '/tags', sort_key='name')
-    platforms = load_yaml_data(step['module_options']['source_directory'] + '/platforms', sort_key='name')
-    software_list = load_yaml_data(step['module_options']['source_directory'] + '/software')
-    licenses = load_yaml_data(step['module_options']['source_directory'] + '/licenses.yml')
+    tags = load_yaml_data(step['module_options']['source_directory'] + '/tags', sort_key='name', typ='safe', cache=True)
+    platforms = load_yaml_data(step['module_options']['source_directory'] + '/platforms', sort_key='name', typ='safe', cache=True)
+    software_list = load_yaml_data(step['module_options']['source_directory'] + '/software', typ='safe', cache=True)
+    licenses = load_yaml_data(step['module_options']['source_directory'] + '/licenses.yml', typ='safe', cache=True)
     # use fieldlist myst-parser extension to limit the TOC depth to 2
     markdown_fieldlist = ':tocdepth: 2\n'
     markdown_content_header = MARKDOWN_INDEX_CONTENT_HEADER
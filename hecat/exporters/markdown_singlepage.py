@@ -300,11 +300,11 @@ def render_markdown_singlepage(step):
     A software item is only listed once, under the first item of its 'tags:' list
     """
     # pylint: disable=consider-using-with
-    tags = load_yaml_data(step['module_options']['source_directory'] + '/tags', sort_key='name')
-    software_list = load_yaml_data(step['module_options']['source_directory'] + '/software')
+    tags = load_yaml_data(step['module_options']['source_directory'] + '/tags', sort_key='name', typ='safe', cache=True)
+    software_list = load_yaml_data(step['module_options']['source_directory'] + '/software', typ='safe', cache=True)
     if 'licenses_file' not in step['module_options']:
         step['module_options']['licenses_file'] = 'licenses.yml'
-    licenses = load_yaml_data(step['module_options']['source_directory'] + '/' + step['module_options']['licenses_file'])
+    licenses = load_yaml_data(step['module_options']['source_directory'] + '/' + step['module_options']['licenses_file'], typ='safe', cache=True)
     markdown_header = ''
     markdown_footer = ''
     if 'markdown_header' in step['module_options']:
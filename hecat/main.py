@@ -28,7 +28,7 @@ def main():
     else:
         logging_handlers = [ logging.StreamHandler() ]
     logging.basicConfig(level=LOG_LEVEL_MAPPING.get(args.log_level), format=LOG_FORMAT, handlers = logging_handlers)
-    config = load_yaml_data(args.config_file)
+    config = load_yaml_data(args.config_file, typ='safe', cache=True)
     for step in config['steps']:
         logging.info('running step %s', step['name'])
         if step['module'] == 'importers/markdown_awesome':
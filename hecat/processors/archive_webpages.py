@@ -208,8 +208,8 @@ def archive_webpages(step):
         step['module_options']['skip_failed'] = False
     for item in items:
         # skip already archived items when skip_already_archived: True
-        if (('skip_already_archived' not in step['module_options'].keys() or
-                step['module_options']['skip_already_archived']) and 'archive_path' in item.keys() and item['archive_path'] is not None):
+        if (('skip_already_archived' not in step['module_options'] or
+                step['module_options']['skip_already_archived']) and 'archive_path' in item and item['archive_path'] is not None):
             logging.debug('skipping %s (id %s): already archived', item['url'], item['id'])
             skipped_count = skipped_count +1
         # skip items matching exclude_tags
@@ -217,7 +217,7 @@ def archive_webpages(step):
             logging.debug('skipping %s (id %s): one or more tags are present in exclude_tags', item['url'], item['id'])
             skipped_count = skipped_count +1
         # skip failed items when skip_failed: True
-        elif (step['module_options']['skip_failed'] and 'archive_error' in item.keys() and item['archive_error']):
+        elif (step['module_options']['skip_failed'] and 'archive_error' in item and item['archive_error']):
             logging.debug('skipping %s (id %s): the previous archival attempt failed, and skip_failed is set to True')
             skipped_count = skipped_count +1
         # archive items matching only_tags
@@ -143,7 +143,7 @@ def check_redirect_sections_empty(step, software, tags_with_redirect, errors):
             assert tag not in tags_with_redirect
         except AssertionError:
             message = "{}: tag {} points to a tag which redirects to another list.".format(software['name'], tag)
-            if 'items_in_redirect_fatal' in step['module_options'].keys() and not step['module_options']['items_in_redirect_fatal']:
+            if 'items_in_redirect_fatal' in step['module_options'] and not step['module_options']['items_in_redirect_fatal']:
                 log_exception(message, errors, severity=logging.warning)
             else:
                 log_exception(message, errors)
@@ -205,7 +205,7 @@ def check_filename_is_kebab_case_software_name(filename, single_yaml_data, error
 def awesome_lint(step):
     """check all software entries against formatting guidelines"""
     logging.info('checking software entries/tags against formatting guidelines.')
-    software_list = load_yaml_data(step['module_options']['source_directory'] + '/software')
+    software_list = load_yaml_data(step['module_options']['source_directory'] + '/software', typ='safe')
     if 'last_updated_info_days' not in step['module_options']:
         step['module_options']['last_updated_info_days'] = 186
     if 'last_updated_warn_days' not in step['module_options']:
@@ -220,13 +220,13 @@ def awesome_lint(step):
         step['module_options']['platforms_required_fields'] = ['description']
     licenses_list = []
     for filename in step['module_options']['licenses_files']:
-        licenses_list = licenses_list + load_yaml_data(step['module_options']['source_directory'] + '/' + filename)
-    tags_list = load_yaml_data(step['module_options']['source_directory'] + '/tags')
+        licenses_list = licenses_list + load_yaml_data(step['module_options']['source_directory'] + '/' + filename, typ='safe')
+    tags_list = load_yaml_data(step['module_options']['source_directory'] + '/tags', typ='safe')
     tags_with_redirect = []
     for tag in tags_list:
         if 'redirect' in tag and tag['redirect']:
             tags_with_redirect.append(tag['name'])
-    platforms_list = load_yaml_data(step['module_options']['source_directory'] + '/platforms')
+    platforms_list = load_yaml_data(step['module_options']['source_directory'] + '/platforms', typ='safe')
     errors = []
     for tag in tags_list:
         check_attribute_in_list(tag, 'related_tags', 'name', tags_list, errors)
@@ -249,7 +249,7 @@ def awesome_lint(step):
         check_required_fields(license, errors, required_fields=LICENSES_REQUIRED_FIELDS)
     for (root, dirs, files) in os.walk(step['module_options']['source_directory'] + '/software'):
         for filename in files:
-            single_yaml_data = load_yaml_data(os.path.join(root, filename))
+            single_yaml_data = load_yaml_data(os.path.join(root, filename), typ='safe')
             check_filename_is_kebab_case_software_name(filename, single_yaml_data, errors)
     if errors:
         logging.error("There were errors during processing")
@@ -97,20 +97,20 @@ def download_media(step):
     ydl_opts['download_archive'] = step['module_options']['output_directory'] + '/' + ydl_opts['download_archive']
     if 'use_download_archive' in step['module_options'] and not step['module_options']['use_download_archive']:
         del ydl_opts['download_archive']
-    if 'download_playlists' in step.keys() and step['download_playlists']:
+    if 'download_playlists' in step and step['download_playlists']:
         ydl_opts['noplaylist'] == False
 
     items = load_yaml_data(step['module_options']['data_file'])
     for item in items:
         # skip download when skip_when_filename_present = True, and video/audio_filename key already exists
-        if (('skip_when_filename_present' not in step['module_options'].keys() or
-                step['module_options']['skip_when_filename_present']) and filename_key in item.keys()):
+        if (('skip_when_filename_present' not in step['module_options'] or
+                step['module_options']['skip_when_filename_present']) and filename_key in item):
             logging.debug('skipping %s (id %s): %s already recorded in the data file', item['url'], item['id'], filename_key)
             skipped_count = skipped_count +1
         # skip download when retry_items_with_error = False, and video/audio_download_error key already exists
         elif ('retry_items_with_error' in step['module_options'] and
                 not step['module_options']['retry_items_with_error'] and
-                error_key in item.keys()):
+                error_key in item):
             logging.debug('skipping %s (id %s): not retrying download on items with %s set', item['url'], item['id'], error_key)
             skipped_count = skipped_count +1
         # skip download when one of the item's tags matches a tag in exclude_tags
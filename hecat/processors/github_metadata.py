@@ -1,5 +1,5 @@
 """github_metadata processor
-Gathers project/repository metadata from GitHub API and adds some fields to YAML data (`updated_at`, `stargazers_count`, `archived`).
+Gathers project/repository metadata from GitHub GraphQL API and adds some fields to YAML data (`updated_at`, `stargazers_count`, `archived`).
 
 # hecat.yml
 steps:
@@ -8,7 +8,14 @@ steps:
     module_options:
       source_directory: tests/awesome-selfhosted-data # directory containing YAML data and software subdirectory
       gh_metadata_only_missing: False # (default False) only gather metadata for software entries in which one of stargazers_count,updated_at, archived is missing
-      sleep_time: 3.7 # (default 0) sleep for this amount of time before each request to Github API
+      sleep_time: 3.7 # (default 0) maximum time to sleep before each request to Github API, requests are only delayed when few requests remain in the rate limit budget
+      requests_per_minute: 60 # (default none) maximum number of requests to Github API per minute, requests are started at a regular interval
+      max_workers: 4 # (default 1) number of concurrent requests to Github API (sleep_time applies to each worker)
+      batch_size: 50 # (default 50) number of projects to gather metadata for in each request to Github API (max 100)
+      cache_file: tests/.github_metadata_cache.json # (default none) file where the last time metadata was gathered for each project is stored
+      cache_ttl_seconds: 86400 # (default 86400) when cache_file is set, don't gather metadata for projects for which it was gathered less than this number of seconds ago
+      errors_are_fatal: True # (default True) if True exit with error code 1 at the end of processing, if metadata could not be gathered for some projects
+      preserve_comments: False # (default False) preserve comments in software YAML files when they are rewritten (slower)
 
 source_directory: path to directory where data files reside. Directory structure:
 ├── software
@@ -26,8 +33,11 @@ On Github Actions a token is created automatically for each job. To make it avai
 env:
   GITHUB_TOKEN: ${{secrets.GITHUB_TOKEN}}
 
-When using GITHUB_TOKEN, the API rate limit is 1,000 requests per hour per repository [[1]](https://docs.github.com/en/rest/overview/resources-in-the-rest-api?apiVersion=2022-11-28#rate-limits-for-requests-from-github-actions)
-Not that each call to get_gh_metadata() results in 2 API requests (on for the repo/stargazers count, one for the latest commit date)
+When using GITHUB_TOKEN, the API rate limit is 1,000 requests per hour per repository [[1]](https://docs.github.com/en/graphql/overview/rate-limits-and-node-limits-for-the-graphql-api)
+Note that each call to get_gh_metadata() results in a single API request, gathering metadata for up to batch_size projects
+If the orjson module is installed, it is used to encode API requests/decode API responses (faster than the standard library json module)
+Processing time is dominated by API requests and rate limiting, not by local processing of the data: to speed it up,
+tune batch_size/max_workers/sleep_time rather than optimizing YAML/JSON handling
 """
 
 import sys
@@ -35,37 +45,246 @@ import logging
 import re
 import os
 import time
-from datetime import datetime
+import threading
+import itertools
+from collections import defaultdict
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import json
 import ruamel.yaml
-import github
+import requests
+try:
+    import orjson
+    json_loads = orjson.loads
+    json_dumps = orjson.dumps
+except ImportError:
+    json_loads = json.loads
+    json_dumps = json.dumps
 from ..utils import load_yaml_data, to_kebab_case
 
 yaml = ruamel.yaml.YAML(typ='rt')
 yaml.indent(sequence=4, offset=2)
 yaml.width = 99999
 
-class DummyGhMetadata(dict):
-    """a dummy metadata object that will be returned when fetching metadata from github API fails"""
-    def __init__(self):
-        self.stargazers_count = 0
-        self.archived = False
+GITHUB_URL_REGEX = re.compile(r'^https://github.com/([\w\.\-]+)/([\w\.\-]+)/?$')
+GITHUB_METADATA_KEYS = frozenset(['stargazers_count', 'updated_at', 'archived'])
 
-def get_gh_metadata(step, github_url, g, errors):
-    """get github project metadata from Github API"""
+GITHUB_GRAPHQL_API = 'https://api.github.com/graphql'
+# aliased repository query, one for each project in a batch
+GITHUB_REPOSITORY_QUERY = '''  repo{index}: repository(owner: "{owner}", name: "{name}") {{
+    stargazerCount
+    isArchived
+    defaultBranchRef {{
+      target {{
+        ... on Commit {{
+          committedDate
+        }}
+      }}
+    }}
+  }}'''
+# requests are not delayed by sleep_time as long as more than this number of requests remain in the rate limit budget
+RATE_LIMIT_SAFETY_MARGIN = 100
+# number of times a request is retried when it is rejected by Github API rate limiting or fails temporarily
+MAX_RETRIES = 5
+# HTTP status codes for temporary failures, retried with exponential backoff starting at RETRY_BACKOFF_TIME seconds
+RETRY_HTTP_CODES = [502, 503, 504]
+RETRY_BACKOFF_TIME = 5
+# dummy metadata that will be used when fetching metadata from github API fails
+DUMMY_GH_METADATA = {'stargazers_count': 0, 'updated_at': '1970-01-01', 'archived': False}
+
+class RateLimiter():
+    """track Github API rate limit status from response headers (x-ratelimit-remaining, x-ratelimit-reset),
+    shared between all workers"""
+    def __init__(self, requests_per_minute=None):
+        self.lock = threading.Lock()
+        self.remaining = None
+        self.reset = 0
+        # minimum interval between the start of two requests, if requests_per_minute is set
+        self.interval = 60 / requests_per_minute if requests_per_minute else 0
+        self.next_request_time = 0
+
+    def acquire(self):
+        """wait until the rate limit is reset if no requests remain, count the request against the remaining budget,
+        wait for the next request slot if requests_per_minute is set"""
+        with self.lock:
+            if self.remaining is not None:
+                if self.remaining <= 0:
+                    wait_time = self.reset - time.time() + 1
+                    if wait_time > 0:
+                        logging.warning('Github API rate limit exhausted, waiting %s seconds for reset', int(wait_time))
+                        time.sleep(wait_time)
+                    self.remaining = None
+                else:
+                    self.remaining = self.remaining - 1
+            # reserve the next slot, time spent waiting for previous responses counts towards the interval
+            now = time.monotonic()
+            slot_wait_time = self.next_request_time - now
+            self.next_request_time = max(now, self.next_request_time) + self.interval
+        if slot_wait_time > 0:
+            time.sleep(slot_wait_time)
+
+    def pacing_time(self, max_sleep_time):
+        """return the time to wait before the next request: 0 while the remaining budget is large,
+        else spread the remaining requests until the reset time, never more than max_sleep_time"""
+        with self.lock:
+            if self.remaining is None:
+                return max_sleep_time
+            if self.remaining > RATE_LIMIT_SAFETY_MARGIN:
+                return 0
+            return min(max_sleep_time, max(0, self.reset - time.time()) / max(1, self.remaining))
+
+    def update(self, response):
+        """update rate limit status from API response headers"""
+        with self.lock:
+            if 'x-ratelimit-remaining' in response.headers and 'x-ratelimit-reset' in response.headers:
+                self.remaining = int(response.headers['x-ratelimit-remaining'])
+                self.reset = int(response.headers['x-ratelimit-reset'])
+                logging.debug('Github API rate limit: %s requests remaining, reset at %s', self.remaining, self.reset)
+
+    def is_rate_limited(self, response, data=None):
+        """return True if the request was rejected by primary or secondary rate limits
+        data is the decoded response body of successful requests"""
+        if response.status_code == 429 or (response.status_code == 403 and 'retry-after' in response.headers):
+            return True
+        if response.headers.get('x-ratelimit-remaining') == '0' and response.status_code != 200:
+            return True
+        # the GraphQL API may also report rate limiting with HTTP 200 and a RATE_LIMITED error instead of data
+        if not isinstance(data, dict) or (data.get('data') is not None and not data.get('errors')):
+            return False
+        return any(graphql_error.get('type') == 'RATE_LIMITED' for graphql_error in data.get('errors') or [])
+
+    def backoff_time(self, response, attempt):
+        """return the time to wait before retrying a rate-limited request"""
+        # Retry-After may also be a HTTP date, use the exponential backoff in this case
+        retry_after = response.headers.get('retry-after', '')
+        if retry_after.isdigit():
+            return int(retry_after)
+        if response.headers.get('x-ratelimit-remaining') == '0':
+            # acquire() waits until the reset time
+            return 0
+        return 60 * 2 ** attempt
+
+def batches(iterable, batch_size):
+    """yield successive lists of at most batch_size items from iterable"""
+    iterator = iter(iterable)
+    batch = list(itertools.islice(iterator, batch_size))
+    while batch:
+        yield batch
+        batch = list(itertools.islice(iterator, batch_size))
+
+def split_batch(items, num_splits):
+    """split a list in num_splits lists of balanced sizes (the first len(items) % num_splits lists get one more item)"""
+    size, remainder = divmod(len(items), num_splits)
+    return [items[i * size + min(i, remainder):(i + 1) * size + min(i + 1, remainder)]
+            for i in range(num_splits) if size or i < remainder]
+
+def get_gh_metadata(step, github_urls, session, rate_limiter, errors):
+    """get metadata for a batch of github projects from Github GraphQL API
+    return a dict of github_url: metadata"""
     if 'sleep_time' in step['module_options']:
-        time.sleep(step['module_options']['sleep_time'])
-    project = re.sub('https://github.com/', '', github_url)
-    project = re.sub('/$', '', project)
+        time.sleep(rate_limiter.pacing_time(step['module_options']['sleep_time']))
+    logging.info('Gathering metadata for %s projects from Github API', len(github_urls))
+    repository_queries = []
+    for index, github_url in enumerate(github_urls):
+        owner, name = GITHUB_URL_REGEX.match(github_url).groups()
+        repository_queries.append(GITHUB_REPOSITORY_QUERY.format(index=index, owner=owner, name=name))
+    query = '{\n' + '\n'.join(repository_queries) + '\n}'
+    gh_metadata = {}
     try:
-        gh_metadata = g.get_repo(project)
-        latest_commit_date = gh_metadata.get_commits()[0].commit.committer.date
-    except github.GithubException as github_error:
-        error_msg = '{} : {}'.format(github_url, github_error)
-        logging.error(error_msg)
-        errors.append(error_msg)
-        gh_metadata = DummyGhMetadata()
-        latest_commit_date = datetime.strptime('1970-01-01', '%Y-%m-%d')
-    return gh_metadata, latest_commit_date
+        for attempt in range(MAX_RETRIES + 1):
+            rate_limiter.acquire()
+            response = session.post(GITHUB_GRAPHQL_API, data=json_dumps({'query': query}), timeout=60)
+            rate_limiter.update(response)
+            # decode the response body once, it is needed to detect rate limiting reported in GraphQL errors
+            data = json_loads(response.content) if response.status_code < 400 else None
+            rate_limited = rate_limiter.is_rate_limited(response, data)
+            if rate_limited:
+                backoff_time = rate_limiter.backoff_time(response, attempt)
+            elif response.status_code in RETRY_HTTP_CODES and len(github_urls) > 1:
+                # large queries may time out repeatedly, split them below instead of retrying
+                break
+            elif response.status_code in RETRY_HTTP_CODES:
+                backoff_time = RETRY_BACKOFF_TIME * 2 ** attempt
+            else:
+                break
+            if attempt == MAX_RETRIES:
+                break
+            if rate_limited:
+                logging.warning('request to Github API was rate limited (HTTP %s), retrying in %s seconds', response.status_code, backoff_time)
+            else:
+                logging.warning('request to Github API failed (HTTP %s), retrying in %s seconds', response.status_code, backoff_time)
+            time.sleep(backoff_time)
+        # retry failed batches as smaller batches, single projects are retried with a backoff above
+        if response.status_code in RETRY_HTTP_CODES and len(github_urls) > 1:
+            logging.warning('request for %s projects failed (HTTP %s), splitting batch', len(github_urls), response.status_code)
+            for split in split_batch(github_urls, 2):
+                gh_metadata.update(get_gh_metadata(step, split, session, rate_limiter, errors))
+            return gh_metadata
+        response.raise_for_status()
+    except (requests.exceptions.RequestException, ValueError) as request_error:
+        # the whole request failed, leave existing metadata for these projects untouched
+        for github_url in github_urls:
+            error_msg = '{} : {}'.format(github_url, request_error)
+            logging.error(error_msg)
+            errors.append(error_msg)
+        return gh_metadata
+    # errors for individual repositories (not found...) are returned alongside data for other repositories
+    # errors without a path apply to the whole query
+    repository_errors = {}
+    query_errors = []
+    for graphql_error in data.get('errors') or []:
+        if graphql_error.get('path'):
+            repository_errors[graphql_error['path'][0]] = graphql_error['message']
+        else:
+            query_errors.append(graphql_error['message'])
+    default_error = '; '.join(query_errors) or 'no repository or commit data returned by Github API'
+    if data.get('data') is None:
+        # the whole query failed, leave existing metadata for these projects untouched
+        for github_url in github_urls:
+            error_msg = '{} : {}'.format(github_url, default_error)
+            logging.error(error_msg)
+            errors.append(error_msg)
+        return gh_metadata
+    for index, github_url in enumerate(github_urls):
+        alias = 'repo{}'.format(index)
+        repository = data['data'].get(alias)
+        if repository is None or repository['defaultBranchRef'] is None:
+            error_msg = '{} : {}'.format(github_url, repository_errors.get(alias, default_error))
+            logging.error(error_msg)
+            errors.append(error_msg)
+            gh_metadata[github_url] = DUMMY_GH_METADATA
+            continue
+        committed_date = repository['defaultBranchRef']['target']['committedDate']
+        # git timestamps are not always converted to UTC, the date is the first 10 characters of UTC (Z) ISO-8601 timestamps
+        if committed_date.endswith('Z'):
+            updated_at = committed_date[:10]
+        else:
+            updated_at = datetime.fromisoformat(committed_date).astimezone(timezone.utc).strftime('%Y-%m-%d')
+        gh_metadata[github_url] = {
+            'stargazers_count': int(repository['stargazerCount']),
+            'updated_at': updated_at,
+            'archived': bool(repository['isArchived'])
+        }
+    return gh_metadata
+
+def metadata_matches(software, gh_metadata):
+    """return True if the software entry already contains all values from gh_metadata
+    values are compared with their types, so that values loaded as another type (unquoted dates loaded
+    as datetime.date objects...) are rewritten with the expected type"""
+    return all(software.get(key) == value for key, value in gh_metadata.items())
+
+def load_cache(cache_file):
+    """load the cache of previously gathered metadata, return a dict of github_url: {'checked_at', 'metadata'}"""
+    if not os.path.isfile(cache_file):
+        return {}
+    with open(cache_file, 'r', encoding="utf-8") as cache:
+        return json.load(cache)
+
+def write_cache(cache_file, cache_data):
+    """write the cache of previously gathered metadata"""
+    with open(cache_file + '.tmp', 'w', encoding="utf-8") as cache:
+        json.dump(cache_data, cache)
+    os.replace(cache_file + '.tmp', cache_file)
 
 def write_software_yaml(step, software):
     """write software data to yaml file"""
@@ -79,38 +298,82 @@ def write_software_yaml(step, software):
 def add_github_metadata(step):
     """gather github project data and add it to source YAML files"""
     GITHUB_TOKEN = os.environ['GITHUB_TOKEN']
-    g = github.Github(GITHUB_TOKEN)
+    max_workers = step['module_options'].get('max_workers', 1)
+    # reuse connections to the API across requests, keep one connection per worker
+    session = requests.Session()
+    session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_workers))
+    session.headers.update({'Authorization': 'bearer ' + GITHUB_TOKEN, 'Content-Type': 'application/json'})
+    rate_limiter = RateLimiter(step['module_options'].get('requests_per_minute'))
     errors = []
-    software_list = load_yaml_data(step['module_options']['source_directory'] + '/software')
+    # all updated files are rewritten from scratch by write_software_yaml(), skip round-trip loading
+    # the round-trip loader is only needed to preserve comments, the safe loader is much faster
+    if step['module_options'].get('preserve_comments', False):
+        software_list = load_yaml_data(step['module_options']['source_directory'] + '/software')
+    else:
+        software_list = load_yaml_data(step['module_options']['source_directory'] + '/software', typ='safe')
     logging.info('updating software data from Github API')
+    # several software entries may point to the same github repository, only query each repository once
+    github_projects = defaultdict(list)
+    only_missing = step['module_options'].get('gh_metadata_only_missing', False)
+    debug_enabled = logging.getLogger().isEnabledFor(logging.DEBUG)
     for software in software_list:
-        github_url = ''
-        if 'source_code_url' in software:
-            if re.search(r'^https://github.com/[\w\.\-]+/[\w\.\-]+/?$', software['source_code_url']):
-                github_url = software['source_code_url']
-        elif 'website_url' in software:
-            if re.search(r'^https://github.com/[\w\.\-]+/[\w\.\-]+/?$', software['website_url']):
-                github_url = software['website_url']
-        if github_url:
+        # website_url is only used for entries without a source_code_url
+        github_url = software.get('source_code_url', software.get('website_url'))
+        if not github_url or not GITHUB_URL_REGEX.search(github_url):
+            continue
+        if debug_enabled:
             logging.debug('%s is a github project URL', github_url)
-            if 'gh_metadata_only_missing' in step['module_options'].keys() and step['module_options']['gh_metadata_only_missing']:
-                if ('stargazers_count' not in software) or ('updated_at' not in software) or ('archived' not in software):
-                    logging.info('Missing metadata for %s, gathering it from Github API', software['name'])
-                    gh_metadata, latest_commit_date = get_gh_metadata(step, github_url, g, errors)
-                    software['stargazers_count'] = int(gh_metadata.stargazers_count)
-                    software['updated_at'] = datetime.strftime(latest_commit_date, "%Y-%m-%d")
-                    software['archived'] = bool(gh_metadata.archived)
-                    write_software_yaml(step, software)
-                else:
-                    logging.debug('all metadata already present, skipping %s', github_url)
+        if only_missing:
+            if not GITHUB_METADATA_KEYS.issubset(software):
+                logging.info('Missing metadata for %s, gathering it from Github API', software['name'])
             else:
-                logging.info('Gathering metadata for %s from Github API', github_url)
-                gh_metadata, latest_commit_date = get_gh_metadata(step, github_url, g, errors)
-                software['stargazers_count'] = gh_metadata.stargazers_count
-                software['updated_at'] = datetime.strftime(latest_commit_date, "%Y-%m-%d")
-                software['archived'] = gh_metadata.archived
-                write_software_yaml(step, software)
+                if debug_enabled:
+                    logging.debug('all metadata already present, skipping %s', github_url)
+                continue
+        github_projects[github_url.rstrip('/').casefold()].append(software)
+    cache_file = step['module_options'].get('cache_file', None)
+    cache_data = {}
+    if cache_file:
+        cache_data = load_cache(cache_file)
+        cache_ttl = step['module_options'].get('cache_ttl_seconds', 86400)
+        now = time.time()
+        for github_url in list(github_projects):
+            cached = cache_data.get(github_url)
+            # only skip projects for which the data on disk still matches gathered metadata
+            if (cached and now - cached['checked_at'] < cache_ttl and
+                    all(metadata_matches(software, cached['metadata']) for software in github_projects[github_url])):
+                logging.debug('metadata for %s was gathered less than %s seconds ago, skipping', github_url, cache_ttl)
+                del github_projects[github_url]
+    # write files in a background thread while waiting for API responses
+    # a single worker is used as the YAML dumper is not thread-safe
+    with ThreadPoolExecutor(max_workers=1) as write_executor, \
+            ThreadPoolExecutor(max_workers=max_workers) as fetch_executor:
+        pending_batches = batches(github_projects, step['module_options'].get('batch_size', 50))
+        fetch_jobs = set()
+        write_jobs = []
+        while True:
+            # keep at most max_workers batches in flight, further batches are only built when a worker is free
+            for batch in itertools.islice(pending_batches, max_workers - len(fetch_jobs)):
+                fetch_jobs.add(fetch_executor.submit(get_gh_metadata, step, batch, session, rate_limiter, errors))
+            if not fetch_jobs:
+                break
+            done_jobs, fetch_jobs = wait(fetch_jobs, return_when=FIRST_COMPLETED)
+            for fetch_job in done_jobs:
+                for github_url, gh_metadata in fetch_job.result().items():
+                    if cache_file and gh_metadata is not DUMMY_GH_METADATA:
+                        cache_data[github_url] = {'checked_at': time.time(), 'metadata': gh_metadata}
+                    for software in github_projects[github_url]:
+                        if metadata_matches(software, gh_metadata):
+                            logging.debug('metadata for %s is unchanged', software['name'])
+                            continue
+                        software.update(gh_metadata)
+                        write_jobs.append(write_executor.submit(write_software_yaml, step, software))
+            if cache_file:
+                write_cache(cache_file, cache_data)
+        for write_job in write_jobs:
+            write_job.result()
     if errors:
         logging.error("There were errors during processing")
         print('\n'.join(errors))
-        sys.exit(1)
+        if step['module_options'].get('errors_are_fatal', True):
+            sys.exit(1)
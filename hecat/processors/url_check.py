@@ -21,77 +21,158 @@ steps:
       exclude_regex: # (default []) don't check URLs matching these regular expressions
         - '^https://github.com/[\w\.\-]+/[\w\.\-]+$' # don't check URLs that will be processed by the github_metadata module
         - '^https://www.youtube.com/watch.*$' # don't check youtube video URLs, always returns HTTP 200 even for unavailable videos
+      max_workers: 8 # (default 1) number of URLs to check concurrently
+      max_workers_per_host: 4 # (default 4) maximum number of concurrent requests to the same host
 """
 
 import sys
 import ruamel.yaml
 import logging
 import re
+import time
+import random
+import threading
+import itertools
+from collections import defaultdict
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from ..utils import load_yaml_data
 import requests
+import urllib3
 
 VALID_HTTP_CODES = [200, 206]
 # INVALID_HTTP_CODES = [403, 404, 500]
+# temporary errors (rate limiting, server errors), retried with exponential backoff
+RETRY_HTTP_CODES = [429, 500, 502, 503, 504]
+MAX_RETRIES = 3
+RETRY_BACKOFF_TIME = 1
+MAX_BACKOFF_TIME = 60
 
-def check_return_code(url, current_item_index, total_item_count, errors):
-    try:
-        # GET only first 200 bytes when possible, servers that do not support the Range: header will simply return the entire page
-        response = requests.get(url, headers={"Range": "bytes=0-200", "User-Agent": "hecat/0.0.1"}, timeout=10)
-        if response.status_code in VALID_HTTP_CODES:
-            logging.info('[%s/%s] %s HTTP %s', current_item_index, total_item_count, url, response.status_code)
-            return True
-        else:
-            error_msg = '{} : HTTP {}'.format(url, response.status_code)
+def retry_backoff_time(response, attempt):
+    """return the time to wait before retrying a request, honoring the Retry-After header when it is a number of seconds"""
+    retry_after = response.headers.get('retry-after', '')
+    if retry_after.isdigit():
+        return min(int(retry_after), MAX_BACKOFF_TIME)
+    backoff_time = min(RETRY_BACKOFF_TIME * 2 ** attempt, MAX_BACKOFF_TIME)
+    # add jitter so that concurrent workers do not retry at the same time
+    return backoff_time + random.uniform(0, backoff_time * 0.1)
+
+def compile_exclude_regex(patterns):
+    """return a list of compiled regular expressions matching any of the patterns
+    patterns are combined in a single alternation when possible, so that each URL is only scanned once"""
+    compiled_patterns = [re.compile(pattern) for pattern in patterns]
+    # combining patterns renumbers capture groups (breaking backreferences) and applies global inline flags
+    # such as (?i) to all patterns, only combine patterns without groups or flags
+    if len(compiled_patterns) < 2 or any(regex.groups or regex.flags != re.compile('').flags for regex in compiled_patterns):
+        return compiled_patterns
+    return [re.compile('|'.join('(?:{})'.format(pattern) for pattern in patterns))]
+
+def head_request_rejected(head_error):
+    """return True if a HEAD request error suggests that the server does not support HEAD requests
+    (read timeout, connection reset or aborted), False if the host is unreachable (DNS failure, connection timeout/refused)"""
+    if isinstance(head_error, requests.exceptions.ReadTimeout):
+        return True
+    return bool(head_error.args) and isinstance(head_error.args[0], urllib3.exceptions.ProtocolError)
+
+def check_return_code(url, current_item_index, total_item_count, errors, session, host_semaphore):
+    # limit the number of concurrent requests to the same host
+    with host_semaphore:
+        try:
+            # HEAD requests do not transfer the response body
+            try:
+                response = session.head(url, timeout=10, allow_redirects=True)
+            except (requests.exceptions.ConnectionError, requests.exceptions.ReadTimeout) as head_error:
+                if not head_request_rejected(head_error):
+                    raise
+                logging.debug('[%s/%s] %s HEAD request failed (%s), retrying with GET', current_item_index, total_item_count, url, head_error)
+                response = None
+            # some servers do not support HEAD requests (dropping the connection or returning a different status code), fall back to GET
+            if response is None or response.status_code not in VALID_HTTP_CODES:
+                # GET only first 200 bytes when possible, servers that do not support the Range: header will simply return the entire page
+                for attempt in range(MAX_RETRIES + 1):
+                    response = session.get(url, headers={"Range": "bytes=0-200"}, timeout=10)
+                    if response.status_code not in RETRY_HTTP_CODES or attempt == MAX_RETRIES:
+                        break
+                    backoff_time = retry_backoff_time(response, attempt)
+                    logging.warning('[%s/%s] %s HTTP %s, retrying in %.1f seconds', current_item_index, total_item_count, url, response.status_code, backoff_time)
+                    time.sleep(backoff_time)
+            if response.status_code in VALID_HTTP_CODES:
+                logging.info('[%s/%s] %s HTTP %s', current_item_index, total_item_count, url, response.status_code)
+                return True
+            else:
+                error_msg = '{} : HTTP {}'.format(url, response.status_code)
+                logging.error('[%s/%s] %s', current_item_index, total_item_count, error_msg)
+                errors.append(error_msg)
+                return False
+        except (requests.exceptions.ConnectionError, requests.exceptions.ReadTimeout, requests.exceptions.ContentDecodingError) as connection_error:
+            error_msg = '{} : {}'.format(url, connection_error)
             logging.error('[%s/%s] %s', current_item_index, total_item_count, error_msg)
             errors.append(error_msg)
             return False
-    except (requests.exceptions.ConnectionError, requests.exceptions.ReadTimeout, requests.exceptions.ContentDecodingError) as connection_error:
-        error_msg = '{} : {}'.format(url, connection_error)
-        logging.error('[%s/%s] %s', current_item_index, total_item_count, error_msg)
-        errors.append(error_msg)
-        return False
 
 def check_urls(step):
     data = []
     errors = []
-    checked_urls = []
-    if 'exclude_regex' not in step['module_options'].keys():
+    checked_urls = set()
+    if 'exclude_regex' not in step['module_options']:
         step['module_options']['exclude_regex'] = []
-    if 'source_directories' not in step['module_options'].keys():
+    if 'source_directories' not in step['module_options']:
         step['module_options']['source_directories'] = []
-    if 'source_files' not in step['module_options'].keys():
+    if 'source_files' not in step['module_options']:
         step['module_options']['source_files'] = []
-    if 'check_keys' not in step['module_options'].keys():
+    if 'check_keys' not in step['module_options']:
         step['module_options']['check_keys'] = ['url', 'source_code_url', 'website_url', 'demo_url']
     for source_dir_or_file in step['module_options']['source_directories'] + step['module_options']['source_files']:
-        new_data = load_yaml_data(source_dir_or_file)
-        data = data + new_data
+        data.extend(load_yaml_data(source_dir_or_file, typ='safe'))
     total_item_count = len(data)
     logging.info('loaded %s items', total_item_count)
     skipped_count = 0
     success_count = 0
     error_count = 0
-    current_item_index = 1
-    for item in data:
-        for key_name in step['module_options']['check_keys']:
+    check_keys = step['module_options']['check_keys']
+    exclude_regex = compile_exclude_regex(step['module_options']['exclude_regex'])
+    # collect unique URLs to check first, then check them concurrently
+    urls_to_check = []
+    for current_item_index, item in enumerate(data, 1):
+        for key_name in check_keys:
             try:
-                if any(re.search(regex, item[key_name]) for regex in step['module_options']['exclude_regex']):
+                if any(regex.search(item[key_name]) for regex in exclude_regex):
                     logging.info('[%s/%s] skipping URL %s, matches exclude_regex', current_item_index, total_item_count, item[key_name])
                     skipped_count = skipped_count + 1
                     continue
                 else:
                     if item[key_name] not in checked_urls:
-                        if check_return_code(item[key_name], current_item_index, total_item_count, errors):
-                            success_count = success_count + 1
-                        else:
-                            error_count = error_count + 1
-                        checked_urls.append(item[key_name])
+                        urls_to_check.append((item[key_name], current_item_index))
+                        checked_urls.add(item[key_name])
             except KeyError:
                 pass
-        current_item_index = current_item_index + 1
+    max_workers = step['module_options'].get('max_workers', 1)
+    # reuse connections to hosts that appear in many URLs, keep up to one connection per worker for each host
+    session = requests.Session()
+    session.headers.update({"User-Agent": "hecat/0.0.1"})
+    adapter = requests.adapters.HTTPAdapter(pool_connections=max(10, max_workers), pool_maxsize=max_workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    # spread the load across hosts, avoid triggering rate limits on hosts that appear in many URLs
+    urls_by_host = defaultdict(list)
+    for url, current_item_index in urls_to_check:
+        urls_by_host[urlparse(url).netloc].append((url, current_item_index))
+    max_workers_per_host = step['module_options'].get('max_workers_per_host', 4)
+    host_semaphores = {host: threading.Semaphore(max_workers_per_host) for host in urls_by_host}
+    if max_workers > 1:
+        # interleave URLs from different hosts so that workers are not all waiting on the same host
+        urls_to_check = [url for urls in itertools.zip_longest(*urls_by_host.values()) for url in urls if url is not None]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(check_return_code, url, current_item_index, total_item_count, errors, session, host_semaphores[urlparse(url).netloc])
+                   for url, current_item_index in urls_to_check]
+        for future in as_completed(futures):
+            if future.result():
+                success_count = success_count + 1
+            else:
+                error_count = error_count + 1
     logging.info('processing complete. Successful: %s - Skipped: %s - Errors: %s', success_count, skipped_count, error_count)
     if errors:
         logging.error("There were errors during processing")
         print('\n'.join(errors))
-        if 'errors_are_fatal' in step['module_options'].keys() and step['module_options']['errors_are_fatal']:
+        if 'errors_are_fatal' in step['module_options'] and step['module_options']['errors_are_fatal']:
             sys.exit(1)
@@ -1,109 +1,180 @@
 """hecat - common utilities"""
 import sys
 import os
+import copy
+import operator
+from collections import OrderedDict
 import ruamel.yaml
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 def list_files(directory):
     """list files in a directory, return an alphabetically sorted list"""
-    source_files = []
-    for _, _, files in os.walk(directory):
-        for file in files:
-            source_files.append(file)
-    return source_files
+    return sorted(entry.name for entry in os.scandir(directory) if entry.is_file())
+
+# characters replaced/removed by to_kebab_case()
+KEBAB_CASE_TRANSLATION_TABLE = str.maketrans({
+    ' ': '-',
+    ':': '-',
+    '(': '',
+    ')': '',
+    '&': '',
+    '/': '',
+    ',': '',
+    '*': '',
+    '\\': '',
+    '<': '',
+    '>': '',
+    '|': '',
+    '?': '',
+    '"': '',
+})
 
 def to_kebab_case(string):
     """convert a string to kebab-case, remove some special characters"""
-    replacements = {
-        ' ': '-',
-        ':': '-',
-        '(': '',
-        ')': '',
-        '&': '',
-        '/': '',
-        ',': '',
-        '*': '',
-        '\\': '',
-        '<': '',
-        '>': '',
-        '|': '',
-        '?': '',
-        '"': '',
-    }
-    newstring = string.translate(str.maketrans(replacements)).lower()
+    newstring = string.translate(KEBAB_CASE_TRANSLATION_TABLE).lower()
     return newstring
 
-def load_yaml_data(path, sort_key=False):
+def read_file(path):
+    """read and return the contents of a file, as bytes"""
+    logging.debug('loading data from %s', path)
+    with open(path, 'rb') as source_file:
+        return source_file.read()
+
+# ruamel.yaml loaders by type, created on first use and reused between calls
+# YAML instances are not thread-safe, they must only be used from the main thread
+YAML_LOADERS = {}
+
+def get_yaml_loader(typ='rt'):
+    """return a (shared) ruamel.yaml YAML instance of the specified type"""
+    if typ not in YAML_LOADERS:
+        YAML_LOADERS[typ] = ruamel.yaml.YAML(typ=typ)
+    return YAML_LOADERS[typ]
+
+def parse_yaml(yaml, content, path):
+    """parse YAML content loaded from path, exit with an error message pointing to the file if it is invalid"""
+    try:
+        return yaml.load(content)
+    except ruamel.yaml.YAMLError as yaml_error:
+        # the parser only sees bytes, the file name is not part of the error message
+        logging.error('error parsing YAML data from %s: %s', path, yaml_error)
+        sys.exit(1)
+
+# ruamel.yaml dumper used by write_data_file()
+YAML_DATA_FILE_WRITER = ruamel.yaml.YAML(typ='rt')
+YAML_DATA_FILE_WRITER.indent(sequence=2, offset=0)
+YAML_DATA_FILE_WRITER.width = 99999
+
+# data loaded by load_yaml_data(cache=True), reused when the same unmodified files are loaded again during the same run
+# (path, sort_key, typ): (signature, data), least recently used entries are discarded first
+YAML_DATA_CACHE = OrderedDict()
+YAML_DATA_CACHE_MAX_ENTRIES = 32
+
+def yaml_data_signature(path, entries=None):
+    """return the modification time and size of a file, or of all files (entries) in a directory"""
+    if entries is None:
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+    return tuple((entry.name, entry.stat().st_mtime_ns, entry.stat().st_size) for entry in entries)
+
+def load_yaml_data(path, sort_key=False, typ='rt', cache=False):
     """load data from YAML source files
     if the path is a file, data will be loaded directly from it
     if the path is a directory, data will be loaded by adding the content of each file in the directory to a list
-    if sort_key=SOMEKEY is passed, items will be sorted alphabetically by the specified key"""
-    yaml = ruamel.yaml.YAML(typ='rt')
-    data = []
+    if sort_key=SOMEKEY is passed, items will be sorted alphabetically by the specified key
+    typ is passed to ruamel.yaml, use typ='safe' (faster, returns plain dicts/lists) when comments/formatting
+    of the source files do not need to be preserved
+    if cache=True is passed, data is cached for the duration of the run, a copy is returned if the files were not modified
+    since they were last loaded (use it for data that is loaded multiple times during the same run)"""
+    if not os.path.isfile(path) and not os.path.isdir(path):
+        logging.error('%s is not a file or directory', path)
+        sys.exit(1)
+    # list directory files once, sorted by name, to check the cache and load them
     if os.path.isfile(path):
-        logging.debug('loading data from %s', path)
-        with open(path, 'r', encoding="utf-8") as yaml_data:
-            data = yaml.load(yaml_data)
+        entries = None
+    else:
+        entries = sorted((entry for entry in os.scandir(path) if entry.is_file()), key=operator.attrgetter('name'))
+    if cache:
+        cache_key = (os.path.abspath(path), sort_key, typ)
+        signature = yaml_data_signature(path, entries)
+        if cache_key in YAML_DATA_CACHE and YAML_DATA_CACHE[cache_key][0] == signature:
+            logging.debug('using previously loaded data for %s', path)
+            YAML_DATA_CACHE.move_to_end(cache_key)
+            return copy.deepcopy(YAML_DATA_CACHE[cache_key][1])
+    yaml = get_yaml_loader(typ)
+    data = []
+    # the parser is fed whole files as bytes, it detects the encoding (UTF-8 unless there is a BOM) and decodes them itself
+    if entries is None:
+        data = parse_yaml(yaml, read_file(path), path)
         if sort_key:
-            data = sorted(data, key=lambda k: k[sort_key].upper())
-        return data
-    elif os.path.isdir(path):
-        for file in sorted(list_files(path)):
-            source_file = path + '/' + file
-            logging.debug('loading data from %s', source_file)
-            with open(source_file, 'r', encoding="utf-8") as yaml_data:
-                item = yaml.load(yaml_data)
+            data.sort(key=lambda k: k[sort_key].upper())
+    else:
+        # DirEntry.path is already joined to the directory path
+        source_files = [entry.path for entry in entries]
+        # read files concurrently to overlap disk I/O, parse them in order in the main thread
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for source_file, yaml_data in zip(source_files, executor.map(read_file, source_files)):
+                item = parse_yaml(yaml, yaml_data, source_file)
                 data.append(item)
             if sort_key:
-                data = sorted(data, key=lambda k: k[sort_key].upper())
-        return data
-    else:
-        logging.error('%s is not a file or directory', path)
-        sys.exit(1)
+                data.sort(key=lambda k: k[sort_key].upper())
+    if cache:
+        # callers may modify the returned data, keep a separate copy in the cache
+        YAML_DATA_CACHE[cache_key] = (signature, copy.deepcopy(data))
+        YAML_DATA_CACHE.move_to_end(cache_key)
+        if len(YAML_DATA_CACHE) > YAML_DATA_CACHE_MAX_ENTRIES:
+            YAML_DATA_CACHE.popitem(last=False)
+    return data
 
 def load_config(config_file):
-    """load steps/settings from a configuration file"""
-    yaml = ruamel.yaml.YAML(typ='rt')
+    """load steps/settings from a configuration file
+    the configuration is cached by load_yaml_data(), a copy is returned so that steps can modify their module_options"""
     logging.debug('loading configuration from %s', config_file)
     if not os.path.isfile(config_file):
-        logging.error('configuration file %s does not exist')
+        logging.error('configuration file %s does not exist', config_file)
         sys.exit(1)
-    with open(config_file, 'r', encoding="utf-8") as cfg:
-        config = yaml.load(cfg)
-    return config
+    return load_yaml_data(config_file, typ='safe', cache=True)
 
 def render_markdown_licenses(step, licenses, back_to_top_url=None):
     """render a markdown-formatted licenses list"""
     if back_to_top_url is not None:
-        markdown_licenses = '--------------------\n\n## List of Licenses\n\n**[`^        back to top        ^`](' + back_to_top_url + ')**\n\n'
+        markdown_licenses = ['--------------------\n\n## List of Licenses\n\n**[`^        back to top        ^`](' + back_to_top_url + ')**\n\n']
     else:
-        markdown_licenses = markdown_licenses = '\n--------------------\n\n## List of Licenses\n\n'
+        markdown_licenses = ['\n--------------------\n\n## List of Licenses\n\n']
+    # exclude_licenses takes precedence over include_licenses, the module options may be missing or empty
+    exclude_licenses = frozenset(step['module_options'].get('exclude_licenses') or [])
+    include_licenses = frozenset(step['module_options'].get('include_licenses') or [])
     for _license in licenses:
-        if step['module_options']['exclude_licenses']:
-            if _license['identifier'] in step['module_options']['exclude_licenses']:
+        if exclude_licenses:
+            if _license['identifier'] in exclude_licenses:
                 logging.debug('license identifier %s listed in exclude_licenses, skipping', _license['identifier'])
                 continue
-        elif step['module_options']['include_licenses']:
-            if _license['identifier'] not in step['module_options']['include_licenses']:
+        elif include_licenses:
+            if _license['identifier'] not in include_licenses:
                 logging.debug('license identifier %s not listed in include_licenses, skipping', _license['identifier'])
                 continue
         try:
-            markdown_licenses += '- `{}` - [{}]({})\n'.format(
+            markdown_licenses.append('- `{}` - [{}]({})\n'.format(
                 _license['identifier'],
                 _license['name'],
-                _license['url'])
+                _license['url']))
         except KeyError as err:
             logging.error('missing fields in license %s: KeyError: %s', _license, err)
             sys.exit(1)
-    return markdown_licenses
+    return ''.join(markdown_licenses)
 
 def write_data_file(step, items):
     """write updated data back to the data file"""
-    yaml = ruamel.yaml.YAML(typ='rt')
-    yaml.indent(sequence=2, offset=0)
-    yaml.width = 99999
-    with open(step['module_options']['data_file'] + '.tmp', 'w', encoding="utf-8") as temp_yaml_file:
-        logging.info('writing temporary data file %s', step['module_options']['data_file'] + '.tmp')
+    yaml = YAML_DATA_FILE_WRITER
+    data_file = step['module_options']['data_file']
+    temp_data_file = data_file + '.tmp'
+    # write the whole file using a large buffer, rather than many small writes
+    with open(temp_data_file, 'w', encoding="utf-8", buffering=1024 * 1024) as temp_yaml_file:
+        logging.info('writing temporary data file %s', temp_data_file)
         yaml.dump(items, temp_yaml_file)
-    logging.info('writing data file %s', step['module_options']['data_file'])
-    os.rename(step['module_options']['data_file'] + '.tmp', step['module_options']['data_file'])
+        # make sure data is on disk before replacing the data file, so that a crash can not leave an empty/truncated file
+        temp_yaml_file.flush()
+        os.fsync(temp_yaml_file.fileno())
+    logging.info('writing data file %s', data_file)
+    # os.replace() atomically overwrites the existing file, including on Windows where os.rename() fails if it exists
+    os.replace(temp_data_file, data_file)
@@ -25,7 +25,7 @@ setup(
     },
     install_requires=[
         'ruamel.yaml==0.17.21',
-        'PyGithub',
+        'requests',
         'yt_dlp',
         'jinja2',
         'Markdown',